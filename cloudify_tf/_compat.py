@@ -22,6 +22,7 @@ PY2 = sys.version_info[0] == 2
 
 if PY2:
     from StringIO import StringIO
+    from urlparse import urlparse
     exec ("""
 def reraise(exception_type, value, traceback):
     raise exception_type, value, traceback
@@ -44,6 +45,7 @@ def exec_(code, globs):
 else:
     import builtins
     from io import StringIO
+    from urllib.parse import urlparse
 
 
     def reraise(exception_type, value, traceback):
@@ -60,4 +62,4 @@ else:
 
 __all__ = [
     'PY2', 'StringIO', 'reraise', 'text_type', 'exec_', 'PermissionDenied',
-    'mkdir_p']
+    'mkdir_p', 'urlparse']
@@ -2,7 +2,8 @@ from functools import wraps
 
 from .terraform import Terraform
 from .utils import (is_using_existing,
-                    get_terraform_source)
+                    get_terraform_source,
+                    operation_cache)
 
 
 def with_terraform(func):
@@ -49,10 +50,11 @@ def with_terraform(func):
                 'system. If necessary, contact your administrator about '
                 'uploading Terraform binaries to the Cloudify manager.')
             return
-        with get_terraform_source() as terraform_source:
-            tf = Terraform.from_ctx(ctx, terraform_source)
-            kwargs['tf'] = tf
-            return func(*args, **kwargs)
+        with operation_cache():
+            with get_terraform_source() as terraform_source:
+                tf = Terraform.from_ctx(ctx, terraform_source)
+                kwargs['tf'] = tf
+                return func(*args, **kwargs)
     return f
 
 
@@ -60,5 +62,6 @@ def skip_if_existing(func):
     @wraps(func)
     def f(*args, **kwargs):
         if not is_using_existing():
-            return func(*args, **kwargs)
+            with operation_cache():
+                return func(*args, **kwargs)
     return f
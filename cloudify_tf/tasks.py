@@ -15,6 +15,8 @@
 
 import os
 import sys
+import shutil
+from contextlib import contextmanager
 
 from cloudify.decorators import operation
 from cloudify.exceptions import NonRecoverableError
@@ -28,6 +30,32 @@ from .decorators import (
 from .terraform import Terraform
 
 
+@contextmanager
+def _wrap_tf_errors(message):
+    """Raise any failure of the wrapped terraform calls as a
+    NonRecoverableError with the given message.
+    """
+    try:
+        yield
+    except Exception as ex:
+        _, _, tb = sys.exc_info()
+        raise NonRecoverableError(
+            message,
+            causes=[exception_to_error_cause(ex, tb)])
+
+
+@contextmanager
+def _reset_init_on_error(tf):
+    """The skipped init may be why the wrapped terraform call failed, so
+    do not skip it again on the next run.
+    """
+    try:
+        yield
+    except Exception:
+        tf.reset_init()
+        raise
+
+
 @operation
 @with_terraform
 def apply(ctx, tf, **_):
@@ -43,15 +71,12 @@ def apply(ctx, tf, **_):
 
 
 def _apply(tf):
-    try:
-        tf.init()
-        tf.plan()
-        tf.apply()
-    except Exception as ex:
-        _, _, tb = sys.exc_info()
-        raise NonRecoverableError(
-            "Failed applying",
-            causes=[exception_to_error_cause(ex, tb)])
+    # "apply -auto-approve" plans by itself, so there is no need for a
+    # separate "plan" run.
+    with _wrap_tf_errors("Failed applying"):
+        tf.init_if_needed()
+        with _reset_init_on_error(tf):
+            tf.apply()
 
 
 @operation
@@ -64,15 +89,10 @@ def state_pull(ctx, tf, **_):
 
 
 def _state_pull(tf):
-    try:
+    with _wrap_tf_errors("Failed pulling state"):
         tf.refresh()
         tf_state = tf.state_pull()
         plan_json = tf.plan_and_show()
-    except Exception as ex:
-        _, _, tb = sys.exc_info()
-        raise NonRecoverableError(
-            "Failed pulling state",
-            causes=[exception_to_error_cause(ex, tb)])
     utils.refresh_resources_properties(tf_state)
     utils.refresh_resources_drifts_properties(plan_json)
 
@@ -92,15 +112,11 @@ def destroy(ctx, tf, **_):
 
 
 def _destroy(tf):
-    try:
-        tf.init()
-        tf.plan()
-        tf.destroy()
-    except Exception as ex:
-        _, _, tb = sys.exc_info()
-        raise NonRecoverableError(
-            "Failed destroying",
-            causes=[exception_to_error_cause(ex, tb)])
+    # "destroy -auto-approve" plans the destruction by itself.
+    with _wrap_tf_errors("Failed destroying"):
+        tf.init_if_needed()
+        with _reset_init_on_error(tf):
+            tf.destroy()
 
 
 @operation
@@ -115,21 +131,45 @@ def reload_template(source, destroy_previous, ctx, tf, **_):
 
     source = utils.handle_previous_source_format(source)
 
-    if destroy_previous:
-        destroy(tf=tf, ctx=ctx)
-
-    with utils.update_terraform_source(source) as terraform_source:
-        new_tf = Terraform.from_ctx(ctx, terraform_source)
-        _apply(new_tf)
-        ctx.instance.runtime_properties['resource_config'] = \
-            utils.get_resource_config()
-        _state_pull(new_tf)
+    prefetched = []
+    try:
+        if destroy_previous:
+            # The new template does not depend on the destroy, so fetch it
+            # in the meantime.
+            utils.run_in_threads(
+                lambda: destroy(tf=tf, ctx=ctx),
+                lambda: prefetched.append(utils.prefetch_source(source)))
+        source_tmp_path = prefetched[0][1] if prefetched else None
+
+        with utils.update_terraform_source(
+                source, source_tmp_path) as terraform_source:
+            new_tf = Terraform.from_ctx(ctx, terraform_source)
+            _apply(new_tf)
+            ctx.instance.runtime_properties['resource_config'] = \
+                utils.get_resource_config()
+            _state_pull(new_tf)
+    finally:
+        # The prefetched template is zipped into the runtime properties by
+        # now, or the operation failed.
+        for prefetch_dir, _ in prefetched:
+            shutil.rmtree(prefetch_dir, ignore_errors=True)
 
 
 @operation
 @skip_if_existing
 def install(ctx, **_):
+    # A previous run of this operation already completed, and the
+    # executable it installed has not changed since.
+    executable_stat = ctx.instance.runtime_properties.get('executable_stat')
+    if executable_stat and \
+            executable_stat == utils.stat_file(executable_stat[0]):
+        ctx.logger.info(
+            'Terraform executable already installed at {path}; '
+            'skipping installation'.format(path=executable_stat[0]))
+        return
+
     installation_dir = utils.get_node_instance_dir()
+    utils.set_storage_path()
     executable_path = utils.get_executable_path()
     plugins = utils.get_plugins()
     plugins_dir = utils.get_plugins_dir()
@@ -150,7 +190,9 @@ def install(ctx, **_):
 
     # store the values in the runtime for safe keeping -> validation
     ctx.instance.runtime_properties['executable_path'] = executable_path
-    utils.handle_plugins(plugins, plugins_dir, installation_dir)
+    utils.handle_plugins(plugins, plugins_dir)
+    ctx.instance.runtime_properties['executable_stat'] = \
+        utils.stat_file(executable_path)
 
 
 @operation
@@ -171,6 +213,7 @@ def uninstall(ctx, **_):
                 path=exc_path))
             os.remove(exc_path)
 
+    dirs_to_delete = []
     for property_name, property_desc in [
         ('plugins_dir',
          'plugins directory'),
@@ -178,7 +221,8 @@ def uninstall(ctx, **_):
          'storage_directory')]:
         dir_to_delete = terraform_config.get(property_name, None)
         if dir_to_delete:
-            utils.remove_dir(dir_to_delete, property_desc)
+            dirs_to_delete.append((dir_to_delete, property_desc))
+    utils.remove_dirs(dirs_to_delete)
 
 
 @operation
@@ -188,15 +232,15 @@ def set_directory_config(ctx, **_):
     storage_path = utils.get_storage_path(target=True)
     deployment_terraform_dir = os.path.join(storage_path,
                                             '.terraform')
+    # get_node_instance_dir creates the directory if it is missing.
     resource_node_instance_dir = utils.get_node_instance_dir(source=True)
-    if not os.path.exists(resource_node_instance_dir):
-        mkdir_p(resource_node_instance_dir)
     resource_terraform_dir = os.path.join(resource_node_instance_dir,
                                           '.terraform')
-    resource_plugins_dir = plugins_dir.replace(
-        ctx.target.instance.id, ctx.source.instance.id)
-    resource_storage_dir = storage_path.replace(
-        ctx.target.instance.id, ctx.source.instance.id)
+    # The storage path is the node instance directory, and the plugins
+    # directory is always inside of it. Mirror that layout for the source.
+    resource_storage_dir = resource_node_instance_dir
+    resource_plugins_dir = os.path.join(
+        resource_storage_dir, os.path.relpath(plugins_dir, storage_path))
 
     if utils.is_using_existing(target=True):
         # We are going to use a TF binary at another location.
@@ -222,9 +266,8 @@ def set_directory_config(ctx, **_):
         dir=resource_plugins_dir))
     ctx.logger.info("setting storage_path to {dir}".format(
         dir=resource_storage_dir))
-    ctx.source.instance.runtime_properties['executable_path'] = \
-        exc_path
-    ctx.source.instance.runtime_properties['plugins_dir'] = \
-        resource_plugins_dir
-    ctx.source.instance.runtime_properties['storage_path'] = \
-        resource_storage_dir
+    ctx.source.instance.runtime_properties.update({
+        'executable_path': exc_path,
+        'plugins_dir': resource_plugins_dir,
+        'storage_path': resource_storage_dir,
+    })
@@ -15,12 +15,15 @@
 
 import os
 import json
+import hashlib
 import tempfile
 
 from contextlib import contextmanager
 
 from .. import utils
 
+LOCK_FILE = '.terraform.lock.hcl'
+
 
 class Terraform(object):
     # TODO: Rework this to put the execute method in its own module.
@@ -95,6 +98,69 @@ class Terraform(object):
         with self._vars_file(command):
             return self.execute(command)
 
+    @property
+    def _init_digest_file(self):
+        return os.path.join(self.root_module, utils.INIT_DIGEST_FILE)
+
+    def _init_digest(self):
+        """Digest of everything that "terraform init" acts upon: the
+        terraform binary, the plugins directory, the module configuration
+        files and the dependency lock file.
+        """
+        digest = hashlib.sha256()
+        digest.update(str(utils.stat_file(self.binary_path)).encode('utf-8'))
+        digest.update(str(self.plugins_dir).encode('utf-8'))
+        for dir_name, subdirs, filenames in os.walk(self.plugins_dir or ''):
+            subdirs.sort()
+            for filename in sorted(filenames):
+                st = os.stat(os.path.join(dir_name, filename))
+                digest.update(str((os.path.join(dir_name, filename),
+                                   st.st_size,
+                                   st.st_mtime)).encode('utf-8'))
+        for dir_name, subdirs, filenames in os.walk(self.root_module):
+            subdirs[:] = sorted(d for d in subdirs if d != '.terraform')
+            for filename in sorted(filenames):
+                if not filename.endswith(('.tf', '.tf.json', LOCK_FILE)):
+                    continue
+                file_path = os.path.join(dir_name, filename)
+                digest.update(file_path.encode('utf-8'))
+                with open(file_path, 'rb') as f:
+                    digest.update(f.read())
+        return digest.hexdigest()
+
+    def init_if_needed(self, additional_args=None):
+        """Run "terraform init", unless the module was already initialized
+        with the same configuration.
+        The digest is kept inside .terraform, so that it is discarded
+        together with whatever init put there.
+        """
+        digest_file = self._init_digest_file
+        try:
+            with open(digest_file) as f:
+                if f.read() == self._init_digest():
+                    self.logger.info('Terraform configuration has not '
+                                     'changed since the last init; '
+                                     'skipping init.')
+                    return
+        except IOError:
+            pass
+        output = self.init(additional_args)
+        # Only now, init may have created or updated the lock file.
+        try:
+            with open(digest_file, 'w') as f:
+                f.write(self._init_digest())
+        except IOError:
+            self.logger.debug('Unable to write {loc}.'.format(
+                loc=digest_file))
+        return output
+
+    def reset_init(self):
+        """Make the next init_if_needed run "terraform init" again."""
+        try:
+            os.remove(self._init_digest_file)
+        except OSError:
+            pass
+
     def destroy(self):
         command = self._tf_command(['destroy', '-auto-approve', '-no-color',
                                     '-input=false'])
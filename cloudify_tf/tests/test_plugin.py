@@ -15,6 +15,7 @@
 
 from os import path
 from mock import patch
+from shutil import rmtree
 from tempfile import mkdtemp
 
 from cloudify.state import current_ctx
@@ -28,10 +29,6 @@ from ..tasks import (install,
 from ..utils import RELATIONSHIP_INSTANCE
 
 
-test_dir1 = mkdtemp()
-test_dir2 = mkdtemp()
-
-
 class MockCloudifyContextRels(MockCloudifyContext):
 
     @property
@@ -41,11 +38,22 @@ class MockCloudifyContextRels(MockCloudifyContext):
 
 class TestPlugin(TestBase):
 
+    @classmethod
+    def setUpClass(cls):
+        super(TestPlugin, cls).setUpClass()
+        cls.workdir = mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        rmtree(cls.workdir, ignore_errors=True)
+        super(TestPlugin, cls).tearDownClass()
+
     def setUp(self):
         super(TestPlugin, self).setUp()
 
-    @patch('cloudify_tf.utils.get_node_instance_dir', return_value=test_dir1)
-    def test_install(self, _):
+    def test_install(self):
+        test_dir1 = mkdtemp(dir=self.workdir)
+
         def get_terraform_conf_props():
             return {
                 "terraform_config": {
@@ -69,7 +77,9 @@ class TestPlugin(TestBase):
         kwargs = {
             'ctx': ctx
         }
-        install(**kwargs)
+        with patch('cloudify_tf.utils.get_node_instance_dir',
+                   return_value=test_dir1):
+            install(**kwargs)
         self.assertEqual(
             ctx.instance.runtime_properties.get("executable_path"),
             conf.get("terraform_config").get("executable_path"))
@@ -83,8 +93,8 @@ class TestPlugin(TestBase):
             path.isfile(ctx.instance.runtime_properties.get(
                 "executable_path")))
 
-    @patch('cloudify_tf.utils.get_node_instance_dir', return_value=test_dir2)
-    def test_set_directory_config(self, _):
+    def test_set_directory_config(self):
+        test_dir2 = mkdtemp(dir=self.workdir)
 
         def get_terraform_conf_props(module_root=test_dir2):
             return {
@@ -129,7 +139,7 @@ class TestPlugin(TestBase):
             ), '_context': {
                 'node_id': '1'
             }})
-        source_work_dir = mkdtemp()
+        source_work_dir = mkdtemp(dir=self.workdir)
         source = MockContext({
             'instance': MockNodeInstanceContext(
                 id='terra_module-1',
@@ -145,7 +155,9 @@ class TestPlugin(TestBase):
         kwargs = {
             'ctx': ctx
         }
-        set_directory_config(**kwargs)
+        with patch('cloudify_tf.utils.get_node_instance_dir',
+                   return_value=test_dir2):
+            set_directory_config(**kwargs)
         self.assertEqual(
             ctx.source.instance.runtime_properties.get("executable_path"),
             ctx.target.instance.runtime_properties.get("executable_path"))
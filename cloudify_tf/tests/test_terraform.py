@@ -0,0 +1,96 @@
+# Copyright (c) 2021 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from os import path, makedirs
+from mock import Mock
+from shutil import rmtree
+from tempfile import mkdtemp
+
+from . import TestBase
+from ..terraform import Terraform, LOCK_FILE
+
+
+class TestTerraform(TestBase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestTerraform, cls).setUpClass()
+        cls.workdir = mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        rmtree(cls.workdir, ignore_errors=True)
+        super(TestTerraform, cls).tearDownClass()
+
+    def setUp(self):
+        super(TestTerraform, self).setUp()
+        self.root_module = mkdtemp(dir=self.workdir)
+        makedirs(path.join(self.root_module, '.terraform'))
+        self.write('main.tf', 'resource "null_resource" "a" {}')
+        self.binary_path = path.join(self.root_module, 'terraform')
+        self.plugins_dir = mkdtemp(dir=self.workdir)
+        self.write('terraform', 'binary')
+        self.write_plugin('provider.zip', 'provider')
+        self.tf = Terraform(Mock(), self.binary_path, self.plugins_dir,
+                            self.root_module, {}, {})
+        # A real init creates the dependency lock file.
+        self.tf.init = Mock(
+            side_effect=lambda *_: self.write(LOCK_FILE, 'provider {}'))
+
+    def write(self, name, content):
+        with open(path.join(self.root_module, name), 'w') as f:
+            f.write(content)
+
+    def write_plugin(self, name, content):
+        with open(path.join(self.plugins_dir, name), 'w') as f:
+            f.write(content)
+
+    def test_init_if_needed_without_digest(self):
+        self.tf.init_if_needed()
+        self.assertEqual(self.tf.init.call_count, 1)
+
+    def test_init_if_needed_digest_matches(self):
+        self.tf.init_if_needed()
+        self.tf.init_if_needed()
+        self.tf.init_if_needed()
+        self.assertEqual(self.tf.init.call_count, 1)
+
+    def test_init_if_needed_digest_mismatch(self):
+        self.tf.init_if_needed()
+        self.write('main.tf', 'resource "null_resource" "b" {}')
+        self.tf.init_if_needed()
+        self.assertEqual(self.tf.init.call_count, 2)
+
+    def test_init_if_needed_binary_changed(self):
+        self.tf.init_if_needed()
+        self.write('terraform', 'another binary')
+        self.tf.init_if_needed()
+        self.assertEqual(self.tf.init.call_count, 2)
+
+    def test_init_if_needed_plugins_changed(self):
+        self.tf.init_if_needed()
+        self.write_plugin('provider.zip', 'another provider')
+        self.tf.init_if_needed()
+        self.assertEqual(self.tf.init.call_count, 2)
+
+    def test_reset_init(self):
+        self.tf.init_if_needed()
+        self.tf.reset_init()
+        self.tf.init_if_needed()
+        self.assertEqual(self.tf.init.call_count, 2)
+        # Nothing to remove.
+        os.remove(path.join(self.root_module, '.terraform',
+                            'cloudify_init.digest'))
+        self.tf.reset_init()
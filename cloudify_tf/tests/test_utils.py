@@ -12,14 +12,48 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import zipfile
+from io import BytesIO
+from os import path, makedirs, access, remove, X_OK
+from mock import Mock, patch
+from shutil import rmtree
+from tempfile import mkdtemp
+
 from cloudify.state import current_ctx
 
 from . import TestBase
-from ..utils import refresh_resources_drifts_properties
+from ..utils import (run_in_threads,
+                     download_in_ranges,
+                     install_binary,
+                     prefetch_source,
+                     run_subprocess,
+                     remove_dirs,
+                     _zip_archive,
+                     _unzip_archive,
+                     INIT_DIGEST_FILE,
+                     is_url,
+                     is_subpath,
+                     snapshot_files,
+                     get_terraform_source,
+                     unzip_and_set_permissions,
+                     operation_cache,
+                     cached_per_operation,
+                     refresh_resources_drifts_properties)
 from ..constants import DRIFTS, IS_DRIFTED
 
 
 class TestUtils(TestBase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestUtils, cls).setUpClass()
+        cls.workdir = mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        rmtree(cls.workdir, ignore_errors=True)
+        super(TestUtils, cls).tearDownClass()
+
     def setUp(self):
         super(TestUtils, self).setUp()
         self.resource_name = "example_vpc"
@@ -77,3 +111,253 @@ class TestUtils(TestBase):
         self.assertEqual(ctx.instance.runtime_properties[IS_DRIFTED], True)
         self.assertDictEqual(ctx.instance.runtime_properties[DRIFTS],
                              {self.resource_name: self.vpc_change})
+
+    def test_run_in_threads(self):
+        ctx = self.mock_ctx("test_run_in_threads", {})
+        current_ctx.set(ctx=ctx)
+        self.assertEqual(
+            run_in_threads(lambda: 1, lambda: current_ctx.get_ctx()),
+            [1, ctx])
+
+        def fail():
+            raise ValueError('failed')
+        self.assertRaises(ValueError, run_in_threads, lambda: 1, fail)
+
+    def test_run_subprocess_return_output(self):
+        ctx = self.mock_ctx("test_run_subprocess_return_output", {})
+        current_ctx.set(ctx=ctx)
+        self.assertEqual(
+            run_subprocess(['echo', '{"serial": 1}'],
+                           cwd=mkdtemp(dir=self.workdir),
+                           return_output=True),
+            '{"serial": 1}\n')
+
+    def test_remove_dirs(self):
+        ctx = self.mock_ctx("test_remove_dirs", {})
+        current_ctx.set(ctx=ctx)
+        storage_path = mkdtemp(dir=self.workdir)
+        plugins_dir = path.join(storage_path, '.terraform', 'plugins')
+        other_dir = mkdtemp(dir=self.workdir)
+        makedirs(plugins_dir)
+        remove_dirs([(plugins_dir, 'plugins directory'),
+                     (storage_path, 'storage directory'),
+                     (other_dir, 'other directory')])
+        self.assertFalse(path.exists(storage_path))
+        self.assertFalse(path.exists(other_dir))
+
+    def test_cached_per_operation(self):
+        ctx = self.mock_ctx("test_cached_per_operation", {})
+        current_ctx.set(ctx=ctx)
+        lookup = Mock(return_value='value')
+        lookup.__name__ = 'lookup'
+        cached_lookup = cached_per_operation(lookup)
+        cached_lookup()
+        cached_lookup()
+        self.assertEqual(lookup.call_count, 2)
+        with operation_cache():
+            cached_lookup()
+            cached_lookup()
+            cached_lookup(target=True)
+        self.assertEqual(lookup.call_count, 4)
+
+    def test_unzip_and_set_permissions(self):
+        ctx = self.mock_ctx("test_unzip_and_set_permissions", {})
+        current_ctx.set(ctx=ctx)
+        zip_data = BytesIO()
+        with zipfile.ZipFile(zip_data, 'w') as zip_file:
+            zip_file.writestr('terraform-provider-fake', 'fake')
+        target_dir = mkdtemp(dir=self.workdir)
+        unzip_and_set_permissions(zip_data, target_dir)
+        self.assertTrue(
+            access(path.join(target_dir, 'terraform-provider-fake'), X_OK))
+
+    def test_run_subprocess_logs_lines(self):
+        ctx = self.mock_ctx("test_run_subprocess_logs_lines", {})
+        current_ctx.set(ctx=ctx)
+        logger = Mock()
+        run_subprocess(['printf', 'first\nsecond\nlast'],
+                       logger=logger, cwd=mkdtemp(dir=self.workdir))
+        self.assertEqual(
+            [c[0][0] for c in logger.info.call_args_list[1:]],
+            ['<out> first', '<out> second', '<out> last'])
+
+    def test_zip_archive_exclude_files(self):
+        ctx = self.mock_ctx("test_zip_archive_exclude_files", {})
+        current_ctx.set(ctx=ctx)
+        source = mkdtemp(dir=self.workdir)
+        plugins_dir = path.join(source, '.terraform', 'plugins')
+        makedirs(plugins_dir)
+        for name in [path.join(plugins_dir, 'provider'),
+                     path.join(source, 'terraform'),
+                     path.join(source, INIT_DIGEST_FILE),
+                     path.join(source, 'main.tf')]:
+            with open(name, 'w') as f:
+                f.write('')
+        archive = _zip_archive(
+            source,
+            exclude_files=[path.join(source, 'terraform'),
+                           plugins_dir,
+                           path.join(source, INIT_DIGEST_FILE)])
+        self.addCleanup(remove, archive)
+        with zipfile.ZipFile(archive) as zip_file:
+            self.assertEqual(zip_file.namelist(), ['main.tf'])
+
+    def test_snapshot_files(self):
+        source = mkdtemp(dir=self.workdir)
+        main_tf = path.join(source, 'main.tf')
+        with open(main_tf, 'w') as f:
+            f.write('')
+        snapshot = snapshot_files(source)
+        self.assertEqual(list(snapshot), [main_tf])
+        self.assertEqual(snapshot, snapshot_files(source))
+        with open(main_tf, 'w') as f:
+            f.write('changed')
+        self.assertNotEqual(snapshot, snapshot_files(source))
+
+    def test_get_terraform_source_unchanged(self):
+        module_root = mkdtemp(dir=self.workdir)
+        main_tf = path.join(module_root, 'main.tf')
+        with open(main_tf, 'w') as f:
+            f.write('')
+        ctx = self.mock_ctx("test_get_terraform_source_unchanged", {},
+                            {'terraform_source': 'stored'})
+        current_ctx.set(ctx=ctx)
+        with patch.multiple('cloudify_tf.utils',
+                            set_storage_path=Mock(return_value=module_root),
+                            get_node_instance_dir=Mock(
+                                return_value=module_root),
+                            get_terraform_source_material=Mock(),
+                            handle_backend=Mock(),
+                            get_source_path=Mock(return_value=None),
+                            extract_binary_tf_data=Mock(),
+                            get_executable_path=Mock(return_value=None),
+                            get_plugins_dir=Mock(return_value=None),
+                            get_resource_config=Mock(return_value={})):
+            # Nothing changed, the stored archive is kept as it is.
+            with get_terraform_source():
+                pass
+            self.assertEqual(
+                ctx.instance.runtime_properties['terraform_source'],
+                'stored')
+            # The operation dropped the stored archive, it is packaged
+            # again, just like when a file changed.
+            with get_terraform_source():
+                ctx.instance.runtime_properties.pop('terraform_source')
+            self.assertNotEqual(
+                ctx.instance.runtime_properties['terraform_source'],
+                'stored')
+            ctx.instance.runtime_properties['terraform_source'] = 'stored'
+            with get_terraform_source():
+                with open(main_tf, 'w') as f:
+                    f.write('changed')
+            self.assertNotEqual(
+                ctx.instance.runtime_properties['terraform_source'],
+                'stored')
+
+    def test_unzip_archive_source_path(self):
+        ctx = self.mock_ctx("test_unzip_archive_source_path", {})
+        current_ctx.set(ctx=ctx)
+        archive = path.join(mkdtemp(dir=self.workdir), 'source.zip')
+        with zipfile.ZipFile(archive, 'w') as zip_file:
+            zip_file.writestr('repo-main/README.md', '')
+            zip_file.writestr('repo-main/tf/main.tf', '')
+            zip_file.writestr('repo-main/tf/modules/vpc/vpc.tf', '')
+            zip_file.writestr('repo-main/tfvars/prod.tfvars', '')
+        target = mkdtemp(dir=self.workdir)
+        _unzip_archive(archive, target, 'tf')
+        for name in ['main.tf',
+                     path.join('modules', 'vpc', 'vpc.tf'),
+                     path.join('repo-main', 'README.md'),
+                     path.join('repo-main', 'tfvars', 'prod.tfvars')]:
+            self.assertTrue(path.isfile(path.join(target, name)), name)
+
+    def test_is_url(self):
+        self.assertTrue(is_url('https://github.com/org/repo/archive/'
+                               'refs/heads/main.zip'))
+        self.assertFalse(is_url('templates/template.zip'))
+        self.assertFalse(is_url('/tmp/template.zip'))
+
+    def test_is_subpath(self):
+        self.assertTrue(is_subpath('/opt/dep/.terraform/plugins', '/opt/dep'))
+        self.assertTrue(is_subpath('/opt/dep/', '/opt/dep'))
+        self.assertFalse(is_subpath('/opt/dep2/.terraform', '/opt/dep'))
+
+    def test_prefetch_source_removes_dir_on_failure(self):
+        download_dir = mkdtemp(dir=self.workdir)
+        with patch('cloudify_tf.utils.tempfile.mkdtemp',
+                   return_value=download_dir), \
+                patch('cloudify_tf.utils.fetch_source',
+                      side_effect=ValueError('failed')):
+            self.assertRaises(ValueError, prefetch_source, {'location': ''})
+        self.assertFalse(path.exists(download_dir))
+
+    def mock_ranged_session(self, payload, headers=None, short=False):
+        session = Mock()
+        session.head.return_value = Mock(
+            url='https://example.com/terraform.zip',
+            headers=headers if headers is not None else {
+                'Accept-Ranges': 'bytes',
+                'Content-Length': str(len(payload))})
+
+        def get(url, headers=None, stream=False, **_):
+            if stream:
+                response = Mock()
+                response.iter_content.return_value = [payload]
+                return response
+            start, end = headers['Range'][len('bytes='):].split('-')
+            content = payload[int(start):int(end) + 1]
+            if short:
+                content = content[:-1]
+            return Mock(status_code=206, content=content)
+        session.get.side_effect = get
+        return session
+
+    def test_download_in_ranges(self):
+        ctx = self.mock_ctx("test_download_in_ranges", {})
+        current_ctx.set(ctx=ctx)
+        payload = bytes(bytearray(range(256))) * (5 * 4096)
+        session = self.mock_ranged_session(payload)
+        self.assertEqual(
+            download_in_ranges('https://example.com/terraform.zip',
+                               session=session),
+            payload)
+        self.assertEqual(session.get.call_count, 4)
+
+    def test_download_in_ranges_not_supported(self):
+        ctx = self.mock_ctx("test_download_in_ranges_not_supported", {})
+        current_ctx.set(ctx=ctx)
+        payload = bytes(bytearray(range(256))) * (5 * 4096)
+        session = self.mock_ranged_session(
+            payload, headers={'Content-Length': str(len(payload))})
+        self.assertIsNone(
+            download_in_ranges('https://example.com/terraform.zip',
+                               session=session))
+        # install_binary falls back to the plain download.
+        installation_dir = mkdtemp(dir=self.workdir)
+        with patch('cloudify_tf.utils.requests.Session',
+                   return_value=session), \
+                patch('cloudify_tf.utils.download_file') as download_file, \
+                patch('cloudify_tf.utils.unzip_and_set_permissions'), \
+                patch('cloudify_tf.utils.os.remove'):
+            install_binary(installation_dir,
+                           path.join(installation_dir, 'terraform'),
+                           'https://example.com/terraform.zip')
+        download_file.assert_called_once_with(
+            'https://example.com/terraform.zip',
+            path.join(installation_dir, 'tf.zip'),
+            session)
+
+    def test_download_in_ranges_bad_part(self):
+        ctx = self.mock_ctx("test_download_in_ranges_bad_part", {})
+        current_ctx.set(ctx=ctx)
+        payload = bytes(bytearray(range(256))) * (5 * 4096)
+        session = self.mock_ranged_session(payload, short=True)
+        self.assertIsNone(
+            download_in_ranges('https://example.com/terraform.zip',
+                               session=session))
+        session = self.mock_ranged_session(payload)
+        session.get.side_effect = None
+        session.get.return_value = Mock(status_code=200, content=payload)
+        self.assertIsNone(
+            download_in_ranges('https://example.com/terraform.zip',
+                               session=session))
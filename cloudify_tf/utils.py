@@ -14,21 +14,22 @@
 # limitations under the License.
 
 import os
-import copy
+import sys
 import json
-import base64
-import ntpath
+import stat
 import shutil
 import zipfile
-import filecmp
 import tempfile
 import requests
 import threading
 import subprocess
 from io import BytesIO
+from base64 import b64encode, b64decode
+from functools import wraps
 from contextlib import contextmanager
 
 from cloudify import ctx
+from cloudify.state import current_ctx, NotInContext
 from cloudify.exceptions import NonRecoverableError
 from cloudify_common_sdk.utils import get_deployment_dir
 from cloudify_common_sdk.resource_downloader import unzip_archive
@@ -44,18 +45,65 @@ except ImportError:
 
 from . import TERRAFORM_BACKEND
 from .constants import IS_DRIFTED, DRIFTS, STATE, NAME
-from ._compat import text_type, StringIO, PermissionDenied, mkdir_p
+from ._compat import (text_type,
+                      PermissionDenied,
+                      mkdir_p,
+                      reraise,
+                      urlparse)
 
 TERRAFORM_STATE_FILE = 'terraform.tfstate'
+# Written by Terraform.init_if_needed, relative to the root module. It is
+# never archived, so init runs again wherever the module is restored.
+INIT_DIGEST_FILE = os.path.join('.terraform', 'cloudify_init.digest')
 
 MASKED_ENV_VARS = {
     'AWS_ACCESS_KEY_ID',
     'AWS_SECRET_ACCESS_KEY'
 }
 
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+OUTPUT_CHUNK_SIZE = 64 * 1024
+ZIP_WRITE_BUFFER_SIZE = 1024 * 1024
+# The terraform_source zip is unpacked again by the next operation, so
+# favour speed over size. Level 1 still shrinks the text files, and the
+# state in particular, to a fraction of their size in the runtime property.
+SOURCE_COMPRESSLEVEL = 1
+# Downloads of at least this size are split into parallel ranged requests.
+RANGED_DOWNLOAD_MIN_SIZE = 4 * 1024 * 1024
+RANGED_DOWNLOAD_PARTS = 4
 
-def download_file(source, destination):
-    run_subprocess(['curl', '-o', source, destination])
+# Values memoized for the duration of an operation, see operation_cache.
+_operation_cache = threading.local()
+
+# Plan actions that do not represent a drift.
+NO_DRIFT_ACTIONS = (['no-op'], ['read'])
+
+
+def download_file(source, destination, session=None):
+    """Download the URL source into the file destination.
+    Pass a requests.Session to reuse its connections between downloads.
+    """
+    with open(destination, 'wb') as f:
+        _download_into(source, f, session)
+
+
+def download_to_memory(source, session=None):
+    """Download the URL source into a file-like object in memory."""
+    data = download_in_ranges(source, session=session)
+    if data:
+        return BytesIO(data)
+    buf = BytesIO()
+    _download_into(source, buf, session)
+    buf.seek(0)
+    return buf
+
+
+def _download_into(source, f, session=None):
+    session = session or requests
+    response = session.get(source, stream=True, timeout=60)
+    response.raise_for_status()
+    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+        f.write(chunk)
 
 
 def run_subprocess(command,
@@ -69,21 +117,21 @@ def run_subprocess(command,
     logger = logger or ctx.logger
     cwd = cwd or get_node_instance_dir()
 
-    if additional_args is None:
-        additional_args = {}
-
-    args_to_pass = copy.deepcopy(additional_args)
+    # Shallow copies are enough, only the env dict is ever modified and it
+    # is always replaced by a new one.
+    args_to_pass = dict(additional_args or {})
 
     if additional_env:
-        passed_env = args_to_pass.setdefault('env', {})
+        passed_env = dict(args_to_pass.get('env', {}))
         passed_env.update(os.environ)
         passed_env.update(additional_env)
+        args_to_pass['env'] = passed_env
 
-    printed_args = copy.deepcopy(args_to_pass)
-    printed_env = printed_args.get('env', {})
-    for env_var in printed_env.keys():
-        if env_var in MASKED_ENV_VARS:
-            printed_env[env_var] = '****'
+    printed_args = dict(args_to_pass)
+    if 'env' in printed_args:
+        printed_args['env'] = dict(
+            (env_var, '****' if env_var in MASKED_ENV_VARS else value)
+            for env_var, value in printed_args['env'].items())
 
     logger.info('Running: command={cmd}, '
                 'cwd={cwd}, '
@@ -116,89 +164,172 @@ def run_subprocess(command,
     if return_code:
         raise subprocess.CalledProcessError(return_code, command)
 
-    output = stdout_consumer.buffer.getvalue() if return_output else None
+    output = stdout_consumer.buffer.getvalue().decode('utf-8') \
+        if return_output else None
     # Leave this commented in case someone wants to debug.
     # logger.debug('Returning output:\n{output}'.format(
     #     output=output if output is not None else '<None>'))
     return output
 
 
-def exclude_file(dirname, filename, excluded_files):
+def run_in_threads(*calls):
+    """Run the given callables concurrently, each in its own thread.
+    The operation context is made available to every thread.
+    Return the results in the order of the callables, or re-raise the first
+    exception that any of them raised.
+    """
+    try:
+        _ctx = current_ctx.get_ctx()
+    except NotInContext:
+        _ctx = None
+    results = [None] * len(calls)
+    errors = []
+
+    def _run(index, call):
+        try:
+            if _ctx:
+                with current_ctx.push(_ctx):
+                    results[index] = call()
+            else:
+                results[index] = call()
+        except Exception:
+            errors.append(sys.exc_info())
+
+    threads = [threading.Thread(target=_run, args=(index, call))
+               for index, call in enumerate(calls)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        reraise(*errors[0])
+    return results
+
+
+def exclude_file(file_path, excluded_files):
     """In _zip_archive, we need to prevent certain files, i.e. the TF binary,
     from being added  to the zip. It's totally unnecessary,
     and also crashes the manager.
+    :param excluded_files: A set of file paths, see split_excluded.
     """
-    rel_path = os.path.join(dirname, filename)
-    for f in excluded_files:
-        if not f:
-            continue
-        elif os.path.isfile(f) and rel_path == f:
-            return True
-        elif os.path.isdir(f) and f in rel_path:
-            return True
-    return False
+    return file_path in excluded_files
 
 
-def exclude_dirs(dirname, subdirs, excluded_files):
+def exclude_dirs(dirname, subdirs, excluded_dirs):
     """In _zip_archive, we need to prevent certain files, i.e. TF plugins,
     from being added  to the zip. It's totally unnecessary,
     and also crashes the manager.
+    :param excluded_dirs: A set of directory paths, see split_excluded.
     """
-    rel_subdirs = [os.path.join(dirname, d) for d in subdirs]
-    for f in excluded_files:
-        if not f:
-            continue
-        if os.path.isdir(f) and f in rel_subdirs:
-            try:
-                subdirs.remove(ntpath.basename(f))
-            except ValueError:
-                pass
+    subdirs[:] = [d for d in subdirs
+                  if os.path.join(dirname, d) not in excluded_dirs]
 
 
-def _zip_archive(extracted_source, exclude_files=None, **_):
+def split_excluded(excluded):
+    """Split a list of excluded paths into a set of files and a set of
+    directories, so that the file system is checked once per path and not
+    once per archived file. The paths are made absolute, to match those
+    that walk_files compares them with.
+    """
+    excluded_files = set()
+    excluded_dirs = set()
+    for f in excluded:
+        if not f:
+            continue
+        f = os.path.abspath(f)
+        if os.path.isfile(f):
+            excluded_files.add(f)
+        elif os.path.isdir(f):
+            excluded_dirs.add(f)
+    return excluded_files, excluded_dirs
+
+
+def _zip_archive(extracted_source,
+                 exclude_files=None,
+                 compresslevel=None,
+                 **_):
     """Zip up a folder and all its sub-folders,
     except for those that we wish to exclude.
 
     :param extracted_source: The location.
     :param exclude_files: A list of files and directories, that we don't
     want to put in the zip.
+    :param compresslevel: The deflate level, zlib's default if None.
+    Ignored before Python 3.7, where zipfile does not support it.
     :param _:
     :return:
     """
-    exclude_files = exclude_files or []
-    ctx.logger.debug('Excluding files {l}'.format(l=exclude_files))
-    ctx.logger.debug("Zipping {source}".format(source=extracted_source))
     with tempfile.NamedTemporaryFile(suffix=".zip",
                                      delete=False) as updated_zip:
         updated_zip.close()
-        with zipfile.ZipFile(updated_zip.name,
-                             mode='w',
-                             compression=zipfile.ZIP_DEFLATED) as output_file:
-            for dir_name, subdirs, filenames in os.walk(extracted_source):
-                # Make sure that the files that we don't want
-                # to include (e.g. plugins directory) will not be archived.
-                exclude_dirs(dir_name, subdirs, exclude_files)
-                for filename in filenames:
-                    # Extra layer of validation on the excluded files.
-                    if not exclude_file(dir_name, filename, exclude_files):
-                        # Create the path as we want to archive it to the
-                        # archivee.
-                        file_to_add = os.path.join(dir_name, filename)
-                        # The name of the file in the archive.
-                        arc_name = file_to_add[len(extracted_source)+1:]
-                        output_file.write(file_to_add, arcname=arc_name)
+        # zipfile writes every header and compressed block separately,
+        # let a large buffer batch them.
+        with open(updated_zip.name, 'wb',
+                  buffering=ZIP_WRITE_BUFFER_SIZE) as zip_file:
+            _write_zip(zip_file,
+                       extracted_source,
+                       exclude_files,
+                       compresslevel)
         archive_file_path = updated_zip.name
     return archive_file_path
 
 
+def _zip_to_base64(extracted_source, exclude_files=None, compresslevel=None):
+    """Like _zip_archive, but zip into memory and return the archive
+    base64 encoded, so that it never goes through the disk.
+    """
+    zip_buffer = BytesIO()
+    _write_zip(zip_buffer, extracted_source, exclude_files, compresslevel)
+    return b64encode(zip_buffer.getvalue()).decode('ascii')
+
+
+def walk_files(root_dir, exclude_files=None):
+    """Yield the absolute path of every file under root_dir, except for the
+    excluded files. Excluded directories are pruned from the walk, so
+    nothing under them is even listed.
+    """
+    excluded_files, excluded_dirs = split_excluded(exclude_files or [])
+    for dir_name, subdirs, filenames in os.walk(os.path.abspath(root_dir)):
+        # Make sure that the files that we don't want
+        # to include (e.g. plugins directory) will not be archived.
+        exclude_dirs(dir_name, subdirs, excluded_dirs)
+        prefix = os.path.join(dir_name, '')
+        for filename in filenames:
+            file_path = prefix + filename
+            # Extra layer of validation on the excluded files.
+            if not exclude_file(file_path, excluded_files):
+                yield file_path
+
+
+def _write_zip(zip_target, extracted_source, exclude_files, compresslevel):
+    """Archive extracted_source into zip_target, a path or a file object."""
+    exclude_files = exclude_files or []
+    ctx.logger.debug('Excluding files {l}'.format(l=exclude_files))
+    ctx.logger.debug("Zipping {source}".format(source=extracted_source))
+    zip_kwargs = {}
+    if compresslevel is not None and sys.version_info >= (3, 7):
+        zip_kwargs['compresslevel'] = compresslevel
+    with zipfile.ZipFile(zip_target,
+                         mode='w',
+                         compression=zipfile.ZIP_DEFLATED,
+                         **zip_kwargs) as output_file:
+        prefix_length = len(os.path.abspath(extracted_source)) + 1
+        for file_to_add in walk_files(extracted_source, exclude_files):
+            # The name of the file in the archive.
+            arc_name = file_to_add[prefix_length:]
+            output_file.write(file_to_add, arcname=arc_name)
+        ctx.logger.debug('Zipped {count} files from {source}.'.format(
+            count=len(output_file.infolist()), source=extracted_source))
+
+
 def _unzip_archive(archive_path, target_directory, source_path=None, **_):
     """
     Unzip a zip archive.
+    The files under source_path, if given, are extracted relative to it,
+    the rest of the archive as it is.
     """
 
-    # Create a temporary directory.
-    # Create a zip archive object.
-    # Extract the object.
     target_directory = target_directory if \
         target_directory.endswith('/') else target_directory + '/'
 
@@ -210,22 +341,37 @@ def _unzip_archive(archive_path, target_directory, source_path=None, **_):
         a=archive_path, b=source_path, c=target_directory))
 
     with zipfile.ZipFile(archive_path, 'r') as zip_ref:
-        for p in zip_ref.namelist():
-            if source_path in p:
-                zip_ref.extract(p, target_directory)
-                reset_source = os.path.join(target_directory, p)
-                reset_target = os.path.join(
-                    target_directory, ntpath.basename(p))
-                os.rename(reset_source, reset_target)
-            else:
-                zip_ref.extractall(target_directory)
+        if not source_path:
+            zip_ref.extractall(target_directory)
+            return target_directory
+        for info in zip_ref.infolist():
+            name = _strip_source_path(info.filename, source_path)
+            if name == '':
+                # The entry of the source path directory itself.
+                continue
+            if name is not None:
+                # ZipFile.open still finds the member by its orig_filename.
+                info.filename = name
+            zip_ref.extract(info, target_directory)
 
     return target_directory
 
 
+def _strip_source_path(name, source_path):
+    """Return the archive member name relative to source_path, or None if
+    the member is not under source_path. source_path may be nested under a
+    top level directory of the archive, e.g. the one of a git archive.
+    """
+    if name.startswith(source_path):
+        return name[len(source_path):]
+    index = name.find('/' + source_path)
+    if index != -1:
+        return name[index + 1 + len(source_path):]
+
+
 def clean_strings(string):
     if isinstance(string, text_type):
-        return string.encode('utf-8').rstrip("'").lstrip("'")
+        return string.strip("'")
     return string
 
 
@@ -234,10 +380,8 @@ def _file_to_base64(file_path):
     # file containing the Terraform files.
     # We need to encode the contents of the file and set them
     # as a runtime property.
-    base64_rep = BytesIO()
     with open(file_path, 'rb') as f:
-        base64.encode(f, base64_rep)
-    return base64_rep.getvalue().decode('utf-8')
+        return b64encode(f.read()).decode('ascii')
 
 
 def _create_source_path(source_tmp_path):
@@ -260,10 +404,9 @@ def _create_source_path(source_tmp_path):
 
 
 def set_permissions(target_file):
-    run_subprocess(
-        ['chmod', 'u+x', target_file],
-        ctx.logger
-    )
+    # Same as "chmod u+x", without forking a process for every file.
+    mode = os.stat(target_file).st_mode
+    os.chmod(target_file, mode | stat.S_IXUSR)
 
 
 def unzip_and_set_permissions(zip_file, target_dir):
@@ -281,10 +424,43 @@ def unzip_and_set_permissions(zip_file, target_dir):
                         name=name,
                         folder=target_dir,
                         err=e))
-            target_file = os.path.join(target_dir, name)
-            ctx.logger.info('Setting executable permission on '
-                            '{loc}.'.format(loc=target_file))
-            set_permissions(target_file)
+            set_permissions(os.path.join(target_dir, name))
+        ctx.logger.debug('Set executable permission on {count} files in '
+                         '{dir}.'.format(count=len(zip_ref.namelist()),
+                                         dir=target_dir))
+
+
+@contextmanager
+def operation_cache():
+    """Memoize the functions decorated with cached_per_operation until the
+    operation returns.
+    """
+    if getattr(_operation_cache, 'values', None) is not None:
+        # An operation that calls another one, e.g. reload_template.
+        yield
+        return
+    _operation_cache.values = {}
+    try:
+        yield
+    finally:
+        _operation_cache.values = None
+
+
+def cached_per_operation(func):
+    """Memoize a lookup per node instance, inside operation_cache only."""
+    @wraps(func)
+    def wrapper(target=False, **kwargs):
+        values = getattr(_operation_cache, 'values', None)
+        if values is None:
+            return func(target=target, **kwargs)
+        key = (func.__name__,
+               get_instance(target=target, **kwargs).id,
+               target,
+               tuple(sorted(kwargs.items())))
+        if key not in values:
+            values[key] = func(target=target, **kwargs)
+        return values[key]
+    return wrapper
 
 
 def get_instance(_ctx=None, target=False, source=False):
@@ -353,19 +529,72 @@ def find_rels_by_type(node_instance, rel_type):
             if rel_type in x.type_hierarchy]
 
 
+def download_in_ranges(url, parts=RANGED_DOWNLOAD_PARTS, session=None):
+    """Download a file into memory with parallel ranged GET requests.
+    Return None if the server does not support ranges, the file is too small
+    to benefit from them, or any of the requests fails.
+    """
+    session = session or requests
+    try:
+        response = session.head(url, allow_redirects=True, timeout=60)
+        response.raise_for_status()
+    except requests.RequestException:
+        return
+    size = int(response.headers.get('Content-Length', 0))
+    if response.headers.get('Accept-Ranges') != 'bytes' or \
+            size < RANGED_DOWNLOAD_MIN_SIZE:
+        return
+    # Don't follow the redirects once per range.
+    url = response.url
+    part_size = -(-size // parts)
+
+    def get_range(start):
+        end = min(start + part_size, size) - 1
+        part = session.get(
+            url,
+            headers={'Range': 'bytes={0}-{1}'.format(start, end)},
+            timeout=60)
+        part.raise_for_status()
+        if part.status_code != 206 or len(part.content) != end - start + 1:
+            raise requests.RequestException(
+                'Unexpected response to ranged request of {url}'.format(
+                    url=url))
+        return part.content
+
+    ctx.logger.info('Downloading {url} in {parts} parts.'.format(
+        url=url, parts=parts))
+    try:
+        return b''.join(run_in_threads(
+            *[lambda start=start: get_range(start)
+              for start in range(0, size, part_size)]))
+    except requests.RequestException as e:
+        ctx.logger.debug('Ranged download of {url} failed: {err}'.format(
+            url=url, err=e))
+
+
 def install_binary(
         installation_dir,
         executable_path,
         installation_source=None):
 
     if installation_source:
-        installation_zip = os.path.join(installation_dir, 'tf.zip')
-        ctx.logger.info(
-            'Downloading Terraform from {source} into {zip}.'.format(
-                source=installation_source,
-                zip=installation_zip))
-        download_file(installation_zip, installation_source)
         executable_dir = os.path.dirname(executable_path)
+        session = requests.Session()
+        try:
+            installation_data = download_in_ranges(
+                installation_source, session=session)
+            if installation_data:
+                unzip_and_set_permissions(
+                    BytesIO(installation_data), executable_dir)
+                return executable_path
+            installation_zip = os.path.join(installation_dir, 'tf.zip')
+            ctx.logger.info(
+                'Downloading Terraform from {source} into {zip}.'.format(
+                    source=installation_source,
+                    zip=installation_zip))
+            download_file(installation_source, installation_zip, session)
+        finally:
+            session.close()
         unzip_and_set_permissions(installation_zip, executable_dir)
         os.remove(installation_zip)
     return executable_path
@@ -384,6 +613,7 @@ def get_resource_config(target=False):
     return node.properties.get('resource_config', {})
 
 
+@cached_per_operation
 def get_terraform_config(target=False):
     """get the cloudify.nodes.terraform or cloudify.nodes.terraform.Module
     terraform_config"""
@@ -398,14 +628,13 @@ def get_terraform_config(target=False):
     return node.properties.get('terraform_config', {})
 
 
-def update_terraform_source_material(new_source, target=False):
-    """Replace the terraform_source material with a new material.
-    This is used in terraform.reload_template operation."""
-    ctx.logger.debug('Updating source material.')
-    instance = get_instance(target=target)
+def fetch_source(new_source, download_dir):
+    """Download the template, if needed, and extract it.
+    Return the path of the extracted template.
+    """
     new_source_location = new_source['location']
     source_tmp_path = get_shared_resource(
-        new_source_location, dir=get_node_instance_dir(target=target),
+        new_source_location, dir=download_dir,
         username=new_source.get('username'),
         password=new_source.get('password'))
     ctx.logger.debug('The shared resource path is {loc}'.format(
@@ -414,10 +643,42 @@ def update_terraform_source_material(new_source, target=False):
     # check if we actually downloaded something or not
     if source_tmp_path == new_source_location:
         source_tmp_path = _create_source_path(source_tmp_path)
+    return source_tmp_path
+
+
+def prefetch_source(new_source):
+    """Fetch a new template into a temporary directory, without touching
+    the node instance directory or runtime properties. This way it can run
+    while the current template is still in use.
+    Return the temporary directory, which the caller should remove, and the
+    path of the extracted template.
+    """
+    download_dir = tempfile.mkdtemp()
+    try:
+        return download_dir, fetch_source(new_source, download_dir)
+    except Exception:
+        shutil.rmtree(download_dir, ignore_errors=True)
+        raise
+
+
+def update_terraform_source_material(new_source,
+                                     target=False,
+                                     source_tmp_path=None):
+    """Replace the terraform_source material with a new material.
+    This is used in terraform.reload_template operation.
+    If the new source was already fetched with prefetch_source, pass its
+    path as source_tmp_path."""
+    ctx.logger.debug('Updating source material.')
+    instance = get_instance(target=target)
+    new_source_location = new_source['location']
+    if not source_tmp_path:
+        source_tmp_path = fetch_source(
+            new_source, get_node_instance_dir(target=target))
 
     # By getting here we will have extracted source
     # Zip the file to store in runtime
-    terraform_source_zip = _zip_archive(source_tmp_path)
+    terraform_source_zip = _zip_archive(
+        source_tmp_path, compresslevel=SOURCE_COMPRESSLEVEL)
     base64_rep = _file_to_base64(terraform_source_zip)
     ctx.logger.info('The before base64_rep size is {size}.'.format(
         size=len(base64_rep)))
@@ -427,14 +688,17 @@ def update_terraform_source_material(new_source, target=False):
     ctx.logger.debug('Updated source material {l}.'.format(
         l=new_source_location))
     instance.update()
-    return base64_rep
+    # The caller gets the zip itself, there is no need to decode what
+    # we have just encoded.
+    return terraform_source_zip
 
 
 def get_terraform_source_material(target=False):
-    """In principle this is the binary data of a zip archive containing the
-    Terraform state and plan files.
-    However, during the install workflow, this might also be the binary
-    data of a zip archive of just the plan files.
+    """In principle this is a zip archive containing the Terraform state and
+    plan files.
+    However, during the install workflow, this might also be a zip archive
+    of just the plan files.
+    Return the path of the archive, which the caller should remove.
     """
     ctx.logger.debug('Getting Terraform source material.')
     instance = get_instance(target=target)
@@ -442,7 +706,7 @@ def get_terraform_source_material(target=False):
     if source:
         ctx.logger.debug('Retrieved terraform source material'
                          ' from runtime properties.')
-        return source
+        return _base64_to_zip(source)
     resource_config = get_resource_config(target=target)
     source = resource_config.get('source')
     return update_terraform_source_material(source, target=target)
@@ -460,6 +724,7 @@ def get_installation_source(target=False):
     return source
 
 
+@cached_per_operation
 def get_executable_path(target=False):
     """The Terraform binary executable.
     It should either be: null, in which case it defaults to
@@ -487,6 +752,7 @@ def get_executable_path(target=False):
     return executable_path
 
 
+@cached_per_operation
 def get_storage_path(target=False):
     """Where we install all of our terraform files.
     It should always be: /opt/manager/resources/deployments/{tenant}
@@ -501,12 +767,22 @@ def get_storage_path(target=False):
             'is no longer supported.')
     ctx.logger.debug('Value storage_path is {loc}.'.format(
         loc=deployment_dir))
-    instance = get_instance(target=target)
-    instance.runtime_properties['storage_path'] = deployment_dir
-    instance.update()
     return deployment_dir
 
 
+def set_storage_path(target=False):
+    """Record the storage path in the runtime properties, and return it.
+    The runtime properties are saved when the operation ends, there is no
+    need to update the instance right away.
+    """
+    storage_path = get_storage_path(target=target)
+    instance = get_instance(target=target)
+    if instance.runtime_properties.get('storage_path') != storage_path:
+        instance.runtime_properties['storage_path'] = storage_path
+    return storage_path
+
+
+@cached_per_operation
 def get_plugins_dir(target=False):
     """Plugins are installed into this directory.
     It should always be: /opt/manager/resources/deployments/{tenant}
@@ -517,7 +793,7 @@ def get_plugins_dir(target=False):
     plugins_dir = resource_config.get(
         'plugins_dir',
         os.path.join(storage_path, '.terraform', 'plugins'))
-    if storage_path not in plugins_dir:
+    if not is_subpath(plugins_dir, storage_path):
         raise NonRecoverableError(
             'Terraform plugins directory {plugins} '
             'must be a subdirectory of the storage_path {storage}.'.format(
@@ -527,6 +803,15 @@ def get_plugins_dir(target=False):
     return plugins_dir
 
 
+def is_subpath(path, parent):
+    """Whether path is parent or inside of it. Unlike a substring check,
+    /opt/foo is not inside of /opt/fo.
+    """
+    path = os.path.normpath(path)
+    parent = os.path.normpath(parent)
+    return path == parent or path.startswith(os.path.join(parent, ''))
+
+
 def get_plugins(target=False):
     """These are plugins that the user wishes to install."""
     resource_config = get_resource_config(target=target)
@@ -538,6 +823,19 @@ def get_source_path(target=False):
     return resource_config.get('source_path')
 
 
+def stat_file(path):
+    """Identify the current version of a file by its path, modification
+    time and size. Return None if the file does not exist.
+    A list is returned, so that the value compares equal after it is
+    stored in runtime properties.
+    """
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return
+    return [path, st.st_mtime, st.st_size]
+
+
 def create_plugins_dir(plugins_dir=None):
     """Create the directory where we will install all the plugins."""
     # Create plugins directory, if needed.
@@ -554,18 +852,43 @@ def create_plugins_dir(plugins_dir=None):
 
 
 def remove_dir(folder, desc=''):
-    if os.path.isdir(folder):
-        ctx.logger.info('Removing {desc}: {dir}'.format(desc=desc, dir=folder))
-        shutil.rmtree(folder)
-    elif os.path.islink(folder):
+    try:
+        mode = os.lstat(folder).st_mode
+    except OSError:
+        mode = 0
+    if stat.S_ISLNK(mode):
         ctx.logger.info('Unlinking: {}'.format(folder))
         os.unlink(folder)
+    elif stat.S_ISDIR(mode):
+        ctx.logger.info('Removing {desc}: {dir}'.format(desc=desc, dir=folder))
+        shutil.rmtree(folder)
     else:
         ctx.logger.info(
             'Directory {dir} doesn\'t exist; skipping'.format(dir=folder))
 
 
-def handle_plugins(plugins, plugins_dir, installation_dir):
+def remove_dirs(folders):
+    """Remove several directories in parallel.
+    :param folders: A list of (directory, description) pairs. A directory
+    that is nested in another one of them is removed together with it.
+    """
+    parents = [os.path.abspath(folder) + os.sep for folder, _ in folders]
+    calls = []
+    seen = set()
+    for folder, desc in folders:
+        folder_path = os.path.abspath(folder)
+        if folder_path in seen:
+            continue
+        seen.add(folder_path)
+        if any(folder_path.startswith(parent) for parent in parents):
+            ctx.logger.debug('{dir} is removed with its parent.'.format(
+                dir=folder))
+            continue
+        calls.append(lambda folder=folder, desc=desc: remove_dir(folder, desc))
+    run_in_threads(*calls)
+
+
+def handle_plugins(plugins, plugins_dir):
     """Create the directory where we will download requested plugins into,
     and then download them into it."""
     create_plugins_dir(plugins_dir)
@@ -584,19 +907,27 @@ def handle_plugins(plugins, plugins_dir, installation_dir):
             'terraform-provider-template_2.1.2_linux_amd64.zip\n'.format(
                 value=plugins)
         )
-    for plugin_name, plugin_url in plugins.items():
-        with tempfile.NamedTemporaryFile(
-                suffix=".zip",
-                delete=False,
-                dir=installation_dir) as plugin_zip:
-            plugin_zip.close()
-            ctx.logger.info('Downloading Terraform plugin: {url}'.format(
-                url=plugin_url))
-            download_file(plugin_zip.name, plugin_url)
-            unzip_path = os.path.join(plugins_dir, plugin_name)
-            mkdir_p(os.path.dirname(unzip_path))
-            unzip_and_set_permissions(plugin_zip.name, unzip_path)
-            os.remove(plugin_zip.name)
+    # The downloads are independent of each other, run them side by side.
+    # They mostly go to the same registry, so share its connections.
+    session = requests.Session()
+    try:
+        run_in_threads(
+            *[lambda name=name, url=url: _install_plugin(
+                name, url, plugins_dir, session)
+              for name, url in plugins.items()])
+    finally:
+        session.close()
+
+
+def _install_plugin(plugin_name, plugin_url, plugins_dir, session=None):
+    ctx.logger.info('Downloading Terraform plugin: {url}'.format(
+        url=plugin_url))
+    # Provider archives are unzipped straight from memory, they never
+    # touch the disk as a zip.
+    plugin_zip = download_to_memory(plugin_url, session)
+    unzip_path = os.path.join(plugins_dir, plugin_name)
+    mkdir_p(os.path.dirname(unzip_path))
+    unzip_and_set_permissions(plugin_zip, unzip_path)
 
 
 def handle_backend(root_dir):
@@ -612,12 +943,17 @@ def handle_backend(root_dir):
     ctx.logger.debug('Extracted Terraform files: {loc}'.format(loc=root_dir))
 
 
-def extract_binary_tf_data(root_dir, data, source_path):
-    """Take this encoded data and put it in a zip file and then unzip it."""
-    with tempfile.NamedTemporaryFile(dir=root_dir, delete=False) as f:
-        base64.decode(StringIO(data), f)
-        terraform_source_zip = f.name
+def _base64_to_zip(data):
+    """Decode the terraform_source runtime property into a zip file."""
+    with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as f:
+        # Older versions stored the encoding split into lines, which
+        # b64decode skips.
+        f.write(b64decode(data))
+    return f.name
+
 
+def extract_binary_tf_data(root_dir, terraform_source_zip, source_path):
+    """Unzip the source material into root_dir, and remove the zip."""
     # By getting here, "terraform_source_zip" is the path
     #  to a ZIP file containing the Terraform files.
     _unzip_archive(terraform_source_zip, root_dir, source_path)
@@ -630,46 +966,71 @@ def get_terraform_source():
     """Get the JSON/TF files material for the Terraform template.
     Dump in in the file yielded by _yield_terraform_source
     """
+    stored = bool(get_instance().runtime_properties.get('terraform_source'))
     material = get_terraform_source_material()
-    return _yield_terraform_source(material)
+    return _yield_terraform_source(material, stored=stored)
 
 
 @contextmanager
-def update_terraform_source(new_source):
+def update_terraform_source(new_source, source_tmp_path=None):
     """Replace the stored terraform resource template data"""
-    material = update_terraform_source_material(new_source)
+    material = update_terraform_source_material(
+        new_source, source_tmp_path=source_tmp_path)
     return _yield_terraform_source(material)
 
 
-def _yield_terraform_source(material):
+def snapshot_files(root_dir, exclude_files=None):
+    """Map every file that _zip_archive would archive from root_dir to its
+    inode, modification time and size.
+    """
+    snapshot = {}
+    for file_path in walk_files(root_dir, exclude_files):
+        st = os.lstat(file_path)
+        snapshot[file_path] = (st.st_ino, st.st_mtime, st.st_size)
+    return snapshot
+
+
+def _yield_terraform_source(material, stored=False):
     """Put all the TF resource template data into the work directory,
     let the operations do all their magic,
     and then store it again for later use.
+    :param stored: Whether material is the archive already stored in the
+    terraform_source runtime property, rather than a new source.
     """
-    module_root = get_storage_path()
+    module_root = set_storage_path()
     handle_backend(module_root)
     source_path = get_source_path()
     extract_binary_tf_data(module_root, material, source_path)
+    exclude_files = [get_executable_path(),
+                     get_plugins_dir(),
+                     os.path.join(module_root, INIT_DIGEST_FILE)]
+    snapshot = snapshot_files(module_root, exclude_files) if stored else None
     try:
         yield get_node_instance_dir()
     finally:
-        ctx.logger.debug('Re-packaging Terraform files from {loc}'.format(
-            loc=module_root))
-        archived_file = _zip_archive(
-            module_root,
-            exclude_files=[get_executable_path(),
-                           get_plugins_dir()])
-        # Convert the zip archive into base64 for storage in runtime
-        # properties.
-        base64_rep = _file_to_base64(archived_file)
-        os.remove(archived_file)
-        ctx.logger.warn('The after base64_rep size is {size}.'.format(
-            size=len(base64_rep)))
-        ctx.instance.runtime_properties['terraform_source'] = base64_rep
+        if snapshot and \
+                'terraform_source' in ctx.instance.runtime_properties and \
+                snapshot == snapshot_files(module_root, exclude_files):
+            # Nothing was written, what is stored is still up to date.
+            ctx.logger.debug('Terraform files in {loc} are unchanged, '
+                             'not re-packaging them.'.format(loc=module_root))
+        else:
+            ctx.logger.debug('Re-packaging Terraform files from {loc}'.format(
+                loc=module_root))
+            # The archive is only needed base64 encoded, for storage in
+            # runtime properties, so build it in memory.
+            base64_rep = _zip_to_base64(
+                module_root,
+                exclude_files=exclude_files,
+                compresslevel=SOURCE_COMPRESSLEVEL)
+            ctx.logger.warn('The after base64_rep size is {size}.'.format(
+                size=len(base64_rep)))
+            ctx.instance.runtime_properties['terraform_source'] = base64_rep
         ctx.instance.runtime_properties['resource_config'] = \
             get_resource_config()
 
 
+@cached_per_operation
 def get_node_instance_dir(target=False, source=False):
     """This is the place where the magic happens.
     We put all our binaries, templates, or symlinks to those files here,
@@ -694,46 +1055,51 @@ def get_terraform_state_file(ctx):
     """
     state_file_path = os.path.join(get_storage_path(), TERRAFORM_STATE_FILE)
 
-    encoded_source = get_terraform_source_material()
-    storage_path = get_storage_path()
-    source_path = get_source_path()
-
-    with tempfile.NamedTemporaryFile(delete=False) as f:
-        base64.decode(StringIO(encoded_source), f)
-        terraform_source_zip = f.name
+    terraform_source_zip = get_terraform_source_material()
+    try:
+        with zipfile.ZipFile(terraform_source_zip, 'r') as zip_ref:
+            # Only the state file is needed, there is no point in
+            # extracting the whole module. Prefer the one closest to the
+            # root of the archive.
+            state_files = sorted(
+                (name for name in zip_ref.namelist()
+                 if os.path.basename(name) == TERRAFORM_STATE_FILE),
+                key=lambda name: name.count('/'))
+            state = zip_ref.read(state_files[0]) if state_files else None
+    finally:
+        os.remove(terraform_source_zip)
+
+    if state is not None:
+        if not os.path.exists(state_file_path):
+            ctx.logger.warn(
+                'There is no existing state file {loc}.'.format(
+                    loc=state_file_path))
+        elif not _file_has_content(state_file_path, state):
+            ctx.logger.warn(
+                'State file from storage is not the same as the '
+                'existing state file {loc}. Using any way.'.format(
+                    loc=state_file_path))
+        with open(state_file_path, 'wb') as f:
+            f.write(state)
+    return state_file_path
 
-    extracted_source = _unzip_archive(terraform_source_zip,
-                                      storage_path,
-                                      source_path)
-    os.remove(terraform_source_zip)
 
-    for dir_name, subdirs, filenames in os.walk(extracted_source):
-        for filename in filenames:
-            if filename == TERRAFORM_STATE_FILE:
-                state_file_from_storage = os.path.join(dir_name, filename)
-                if not os.path.exists(state_file_path):
-                    ctx.logger.warn(
-                        'There is no existing state file {loc}.'.format(
-                            loc=state_file_path))
-                if not filecmp.cmp(state_file_from_storage, state_file_path):
-                    ctx.logger.warn(
-                        'State file from storage is not the same as the '
-                        'existing state file {loc}. Using any way.'.format(
-                            loc=state_file_path))
-                shutil.move(os.path.join(dir_name, filename), state_file_path)
-                break
-
-    shutil.rmtree(extracted_source)
-    return state_file_path
+def _file_has_content(path, content):
+    # A different size settles it without reading the file.
+    if os.path.getsize(path) != len(content):
+        return False
+    with open(path, 'rb') as f:
+        return f.read() == content
 
 
 def create_backend_string(name, options):
     # TODO: Get a better way of setting backends.
-    option_string = ''
-    for option_name, option_value in options.items():
-        if isinstance(option_value, text_type):
-            option_value = '"%s"' % option_value
-        option_string += '    %s = %s\n' % (option_name, option_value)
+    option_string = ''.join(
+        '    %s = %s\n' % (
+            option_name,
+            '"%s"' % option_value if isinstance(option_value, text_type)
+            else option_value)
+        for option_name, option_value in options.items())
     backend_block = TERRAFORM_BACKEND % (name, option_string)
     return 'terraform {\n%s\n}' % backend_block
 
@@ -764,22 +1130,23 @@ def refresh_resources_drifts_properties(plan_json):
         here: https://www.terraform.io/docs/internals/json-format.html#plan
         -representation
     """
-    ctx.instance.runtime_properties[IS_DRIFTED] = False
-    drifts = {}
-    resource_changes = plan_json.get('resource_changes', [])
-    for resource_change in resource_changes:
-        change = resource_change.get('change', {})
-        if change['actions'] not in [['no-op'], ['read']]:
-            ctx.instance.runtime_properties[IS_DRIFTED] = True
-            drifts[resource_change[NAME]] = change
-    ctx.instance.runtime_properties[DRIFTS] = drifts
+    drifts = {
+        resource_change[NAME]: resource_change['change']
+        for resource_change in plan_json.get('resource_changes', [])
+        if resource_change['change']['actions'] not in NO_DRIFT_ACTIONS}
+    runtime_properties = ctx.instance.runtime_properties
+    runtime_properties[IS_DRIFTED] = bool(drifts)
+    runtime_properties[DRIFTS] = drifts
 
 
 def is_url(string):
+    """Tell a URL from a path by its syntax, without going to the network.
+    """
     try:
-        return requests.get(string)
-    except requests.ConnectionError:
+        parsed = urlparse(string)
+    except (AttributeError, ValueError):
         return False
+    return bool(parsed.scheme and parsed.netloc)
 
 
 def handle_previous_source_format(source):
@@ -800,12 +1167,24 @@ class OutputConsumer(object):
         self.out = out
         self.consumer = threading.Thread(target=self.consume_output)
         self.consumer.daemon = True
+        self.partial_line = b''
 
     def consume_output(self):
-        for line in self.out:
-            self.handle_line(line)
+        # Read whatever the pipe has, up to a large chunk, instead of
+        # iterating over it line by line.
+        fd = self.out.fileno()
+        for chunk in iter(lambda: os.read(fd, OUTPUT_CHUNK_SIZE), b''):
+            self.handle_chunk(chunk)
+        if self.partial_line:
+            self.handle_line(self.partial_line)
         self.out.close()
 
+    def handle_chunk(self, chunk):
+        lines = (self.partial_line + chunk).split(b'\n')
+        self.partial_line = lines.pop()
+        for line in lines:
+            self.handle_line(line + b'\n')
+
     def handle_line(self, line):
         raise NotImplementedError("Must be implemented by subclass")
 
@@ -828,11 +1207,15 @@ class LoggingOutputConsumer(OutputConsumer):
 class CapturingOutputConsumer(OutputConsumer):
     def __init__(self, out):
         OutputConsumer.__init__(self, out)
-        self.buffer = StringIO()
+        self.buffer = BytesIO()
         self.consumer.start()
 
+    def handle_chunk(self, chunk):
+        # Keep the raw bytes, run_subprocess decodes them once at the end.
+        self.buffer.write(chunk)
+
     def handle_line(self, line):
-        self.buffer.write(line.decode('utf-8'))
+        self.buffer.write(line)
 
     def get_buffer(self):
         return self.buffer